@@ -1,13 +1,19 @@
-import time
+import asyncio
+import atexit
 import os
 import json
+import time
 from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import re
+import signal
 from datetime import datetime, timedelta
+from email.utils import parsedate_to_datetime
+import html
+from urllib.parse import parse_qs, urljoin, urlsplit
 from zoneinfo import ZoneInfo
 from dotenv import load_dotenv
-import requests
-from twilio.rest import Client
+import httpx
 
 # ------------------------------------------------------------------------
 # 1. Configuration & Logging Setup
@@ -21,12 +27,34 @@ CHECK_URL = os.getenv("CHECK_URL")
 
 MAX_SAVED_RESPONSES = 10
 
+# Single worker, so saved pages are written and deleted in the order they were queued
+_IO_POOL = ThreadPoolExecutor(max_workers=1)
+
+# Timestamp formats for log lines, log file names and saved page names
+_TS_LOG = "%Y-%m-%d %H:%M:%S"
+_TS_DATE = "%Y-%m-%d"
+_TS_FILE = "%Y%m%d_%H%M%S"
+
 # Directory for log files
 LOGS_DIR = "logs"
+LOG_FILE_RE = re.compile(r"log_(\d{4}-\d{2}-\d{2})\.txt")
 os.makedirs(LOGS_DIR, exist_ok=True)  # Ensure logs directory exists
 
-# Twilio client
-twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+# Directory for pages saved in test interactive mode
+RESPONSES_DIR = "responses"
+os.makedirs(RESPONSES_DIR, exist_ok=True)  # Ensure responses directory exists
+
+# Status change history (JSON Lines); the legacy JSON array file is migrated on start
+STATE_CHANGES_FILE = "state_changes.jsonl"
+LEGACY_STATE_CHANGES_FILE = "state_changes.json"
+
+# Cached location of Best Buy's JSON inventory (button state) endpoint for the SKU,
+# looked up on the product page again once the cache is a week old
+INVENTORY_CACHE_FILE = "inventory_endpoint.json"
+INVENTORY_MAX_AGE_SECONDS = 7 * 24 * 60 * 60
+
+# Twilio client, created on the first call (see get_twilio_client())
+_twilio_client = None
 
 # Strings to check
 SOLD_OUT_TEXT = "This item is currently sold out but we are working to get more inventory."
@@ -35,8 +63,8 @@ SOLD_OUT_TEXT = "This item is currently sold out but we are working to get more
 HEADERS = {
     "accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,"
               "image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
+    "accept-encoding": "gzip, deflate, br",
     "accept-language": "en-US,en;q=0.9",
-    "cache-control": "max-age=0",
     "cookie": "dtSa=-",
     "dnt": "1",
     "priority": "u=0, i",
@@ -54,89 +82,181 @@ HEADERS = {
                    "Chrome/132.0.0.0 Safari/537.36 Edg/132.0.0.0")
 }
 
+# HTTP/2 keeps one TLS connection to Best Buy open between polls and HPACK-compresses
+# the repeated HEADERS. The same limits are used by the async client in monitor mode.
+HTTP_LIMITS = httpx.Limits(max_keepalive_connections=4, keepalive_expiry=600)
+CLIENT = httpx.Client(http2=True, headers=HEADERS, timeout=10.0, limits=HTTP_LIMITS)
+
 
 # ------------------------------------------------------------------------
 # 2. Logging Functions
 # ------------------------------------------------------------------------
 def get_today_log_file():
     """Returns a log filename based on the current date, stored in the logs/ folder."""
-    today_str = datetime.now().strftime("%Y-%m-%d")
+    today_str = time.strftime(_TS_DATE)
     return os.path.join(LOGS_DIR, f"log_{today_str}.txt")
 
+# Today's log file is kept open between calls and reopened when the date rolls over.
+# Writes are block-buffered and flushed every LOG_FLUSH_LINES lines, before each
+# monitor-mode wait, and on exit (including exits caused by SIGTERM / SIGINT).
+LOG_BUFFER_SIZE = 65536
+LOG_FLUSH_LINES = 50
+_log_file = None
+_log_date = None
+_log_lines_unflushed = 0
+
+def flush_log_file():
+    """Pushes any buffered log lines to disk."""
+    global _log_lines_unflushed
+    if _log_file is not None:
+        _log_file.flush()
+    _log_lines_unflushed = 0
+
+def close_log_file():
+    """Closes the open log file, flushing anything still buffered."""
+    global _log_file, _log_date, _log_lines_unflushed
+    if _log_file is not None:
+        _log_file.close()
+        _log_file = None
+    _log_date = None
+    _log_lines_unflushed = 0
+
+def handle_shutdown_signal(signum, frame):
+    """
+    Turns SIGTERM / SIGINT into a normal interpreter exit so the atexit hook flushes and
+    closes the log. The log isn't touched here, since the signal may arrive mid-write.
+    """
+    if signum == signal.SIGINT:
+        raise KeyboardInterrupt
+    raise SystemExit(128 + signum)
+
+atexit.register(close_log_file)
+
 def log_message(message: str):
     """
     Prints the message with a timestamp, and also appends it to today's log file.
     """
-    timestamp_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    global _log_file, _log_date, _log_lines_unflushed
+    local_time = time.localtime()
+    timestamp_str = time.strftime(_TS_LOG, local_time)
     line = f"[{timestamp_str}] {message}"
     print(line)
 
     # Append to today's log
-    with open(get_today_log_file(), "a", encoding="utf-8") as f:
-        f.write(line + "\n")
+    today = time.strftime(_TS_DATE, local_time)
+    if today != _log_date:
+        close_log_file()
+        _log_file = open(get_today_log_file(), "a", encoding="utf-8", buffering=LOG_BUFFER_SIZE)
+        _log_date = today
+    _log_file.write(line + "\n")
+
+    _log_lines_unflushed += 1
+    if _log_lines_unflushed >= LOG_FLUSH_LINES:
+        flush_log_file()
 
 def cleanup_old_logs():
     """
     Removes log files older than 30 days in the logs/ folder.
     Expects files named like 'log_YYYY-MM-DD.txt'.
     """
-    cutoff = datetime.now() - timedelta(days=30)
-    for filename in os.listdir(LOGS_DIR):
-        if filename.startswith("log_") and filename.endswith(".txt"):
-            date_str = filename[len("log_"):-4]  # Extract 'YYYY-MM-DD'
-            try:
-                file_date = datetime.strptime(date_str, "%Y-%m-%d")
-                if file_date < cutoff:
-                    os.remove(os.path.join(LOGS_DIR, filename))
-                    log_message(f"Removed old log file: {filename}")
-            except ValueError:
-                pass
+    # Zero-padded ISO dates sort chronologically, so the names can be compared as strings
+    cutoff_str = (datetime.now() - timedelta(days=30)).strftime(_TS_DATE)
+    with os.scandir(LOGS_DIR) as entries:
+        for entry in entries:
+            if not entry.is_file(follow_symlinks=False):
+                continue
+            match = LOG_FILE_RE.fullmatch(entry.name)
+            if match and match.group(1) < cutoff_str:  # group 1 is 'YYYY-MM-DD'
+                os.remove(entry.path)
+                log_message(f"Removed old log file: {entry.name}")
 
 def log_state_change(old_status, new_status):
     """
-    When a status change occurs, record it in 'state_changes.json' as a JSON array of events.
+    When a status change occurs, append it to 'state_changes.jsonl' as one JSON object per line.
     """
-    data = []
-    if os.path.exists("state_changes.json"):
-        try:
-            with open("state_changes.json", "r", encoding="utf-8") as f:
-                data = json.load(f)
-        except:
-            pass
-
     event = {
         "timestamp": datetime.now().isoformat(),
         "old_status": old_status,
         "new_status": new_status
     }
-    data.append(event)
+    with open(STATE_CHANGES_FILE, "a", encoding="utf-8") as f:
+        f.write(json.dumps(event) + "\n")
 
-    with open("state_changes.json", "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
+def migrate_state_changes():
+    """
+    One-time conversion of the old 'state_changes.json' array into 'state_changes.jsonl'.
+    The legacy events are older than anything already in the JSONL file, so they are
+    written ahead of it. The old file is removed once converted; a file that isn't a
+    readable JSON array is logged and left in place.
+    """
+    if not os.path.exists(LEGACY_STATE_CHANGES_FILE):
+        return
 
+    try:
+        with open(LEGACY_STATE_CHANGES_FILE, "r", encoding="utf-8") as f:
+            events = json.load(f)
+        if not isinstance(events, list):
+            raise ValueError("expected a JSON array of events")
+
+        existing = ""
+        if os.path.exists(STATE_CHANGES_FILE):
+            with open(STATE_CHANGES_FILE, "r", encoding="utf-8") as f:
+                existing = f.read()
+
+        temp_path = STATE_CHANGES_FILE + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for event in events:
+                f.write(json.dumps(event) + "\n")
+            f.write(existing)
+        # Remove the legacy file before swapping the merged history in, so a failure
+        # can never leave both in place and migrate the same events twice
+        os.remove(LEGACY_STATE_CHANGES_FILE)
+        os.replace(temp_path, STATE_CHANGES_FILE)
+    except (OSError, ValueError) as e:
+        log_message(f"Could not migrate {LEGACY_STATE_CHANGES_FILE}: {e}")
+        return
+
+    log_message(f"Migrated {len(events)} event(s) from {LEGACY_STATE_CHANGES_FILE} to {STATE_CHANGES_FILE}")
 
 # ------------------------------------------------------------------------
 # 3. Dynamic Wait Time (6 AM to 2 PM PT, M-F => 1 min, else => 10 min)
 # ------------------------------------------------------------------------
+LA_TZ = ZoneInfo("America/Los_Angeles")
+
+# (epoch hour, wait seconds) of the last computation. PT offsets are whole hours,
+# so the answer can only change when the epoch hour does.
+_wait_time_cache = (None, None)
+
 def get_current_wait_time_seconds():
     """
     Monday-Friday (weekday < 5), from 6 AM PT to 1:59 PM PT => 60s
     Otherwise => 600s
+    Cached for the current hour.
     """
-    now_pt = datetime.now(ZoneInfo("America/Los_Angeles"))  # Current Pacific Time
+    global _wait_time_cache
+    current_hour = int(time.time() // 3600)
+    if current_hour == _wait_time_cache[0]:
+        return _wait_time_cache[1]
+
+    now_pt = datetime.now(LA_TZ)  # Current Pacific Time
     # weekday(): Monday=0, Sunday=6
     # hour in 24h format => 6 <= hour < 14 means 6 AM to 1:59 PM
     if now_pt.weekday() < 5 and 6 <= now_pt.hour < 14:
-        return 60
+        wait_time_seconds = 60
     else:
-        return 600
+        wait_time_seconds = 600
+
+    _wait_time_cache = (current_hour, wait_time_seconds)
+    return wait_time_seconds
 
 # ------------------------------------------------------------------------
 # 4. Extract SKU
 # ------------------------------------------------------------------------
+SKU_RE = re.compile(r"skuId=(\d+)")
+
 def extract_sku(url):
     """Extracts 'skuId=#######' from the URL. Returns the digits as a string."""
-    match = re.search(r"skuId=(\d+)", url)
+    match = SKU_RE.search(url)
     if match:
         return match.group(1)
     return None
@@ -148,41 +268,255 @@ if not SKU:
 
 ADD_TO_CART_MARKER = f'data-sku-id="{SKU}" data-button-state="ADD_TO_CART"'
 
+# Markers are matched against the raw response bytes, so no decoding is needed on the scan path
+SOLD_OUT_BYTES = SOLD_OUT_TEXT.encode("utf-8")
+ADD_TO_CART_BYTES = ADD_TO_CART_MARKER.encode("utf-8")
+
+# Single pattern for both markers so the page is scanned once; group 1 => sold out, 2 => in stock
+STATUS_PATTERN = re.compile(b"(%s)|(%s)" % (re.escape(SOLD_OUT_BYTES), re.escape(ADD_TO_CART_BYTES)))
+
+# Inventory XHR referenced by the product page (path plus the query string the page uses),
+# and the headers a browser sends with it
+INVENTORY_PATH_RE = re.compile(rb"""/button-state/api/v\d+/button-state(?:\?[^"'\s<>]*)?""")
+INVENTORY_HEADERS = {
+    "accept": "application/json",
+    "referer": CHECK_URL,
+    "sec-fetch-dest": "empty",
+    "sec-fetch-mode": "cors",
+    "sec-fetch-site": "same-origin",
+}
+
+# Streamed pages are read in chunks of this size; the last MARKER_OVERLAP bytes
+# of each chunk are carried over so markers spanning two chunks are still found
+CHUNK_SIZE = 16384
+MARKER_OVERLAP = max(len(SOLD_OUT_BYTES), len(ADD_TO_CART_BYTES)) - 1
+
 # ------------------------------------------------------------------------
 # 5. check_status()
 # ------------------------------------------------------------------------
+def parse_status(page_bytes):
+    """
+    Returns "sold_out", "in_stock", or "fail" based on the markers in the page HTML.
+    The sold-out text wins whenever it is present, even after the add-to-cart marker.
+    """
+    match = STATUS_PATTERN.search(page_bytes)
+    if not match:
+        return "fail"
+    if match.lastindex == 1 or page_bytes.find(SOLD_OUT_BYTES, match.end()) != -1:
+        return "sold_out"
+    return "in_stock"
+
+def scan_chunk(tail, chunk):
+    """
+    Checks one streamed chunk of the page, prefixed with the tail of the previous chunk
+    so a marker split across a chunk boundary still matches.
+    Returns (status, new_tail), where status is None if neither marker is in the window.
+    """
+    window = tail + chunk
+    status = parse_status(window)
+    return (None if status == "fail" else status), window[-MARKER_OVERLAP:]
+
+# Validators of the last full page, sent back so an unchanged page comes back as a 304
+_last_etag = None
+_last_modified = None
+_last_status = None
+
+def get_conditional_headers():
+    """Returns If-None-Match / If-Modified-Since headers for the last page seen, if any."""
+    headers = {}
+    if _last_etag:
+        headers["If-None-Match"] = _last_etag
+    if _last_modified:
+        headers["If-Modified-Since"] = _last_modified
+    return headers
+
+def remember_validators(response_headers, current_status):
+    """Stores the ETag / Last-Modified of a 200 response along with the status it resolved to."""
+    global _last_etag, _last_modified, _last_status
+    _last_etag = response_headers.get("ETag")
+    _last_modified = response_headers.get("Last-Modified")
+    _last_status = current_status
+
+# {"sku", "url", "checked_at"} of the inventory endpoint. url is None if the page had none,
+# or if the one it had was rejected; either way the page is polled until the weekly check.
+_inventory_endpoint = None
+
+def load_inventory_endpoint():
+    """Returns the cached inventory endpoint record for SKU, reading it from disk on first use."""
+    global _inventory_endpoint
+    if _inventory_endpoint is None:
+        try:
+            with open(INVENTORY_CACHE_FILE, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            cached = None
+        _inventory_endpoint = cached if isinstance(cached, dict) and cached.get("sku") == SKU else {}
+    return _inventory_endpoint
+
+def inventory_endpoint_needs_check():
+    """True if the product page hasn't been searched for the inventory endpoint in the last week."""
+    checked_at = load_inventory_endpoint().get("checked_at", 0)
+    return time.time() - checked_at >= INVENTORY_MAX_AGE_SECONDS
+
+def save_inventory_endpoint(url):
+    """Caches the endpoint record in memory and in INVENTORY_CACHE_FILE, stamped with the current time."""
+    global _inventory_endpoint
+    _inventory_endpoint = {"sku": SKU, "url": url, "checked_at": time.time()}
+    try:
+        with open(INVENTORY_CACHE_FILE, "w", encoding="utf-8") as f:
+            json.dump(_inventory_endpoint, f, indent=2)
+    except OSError as e:
+        log_message(f"Error saving {INVENTORY_CACHE_FILE}: {e}")
+
+def reject_inventory_endpoint(reason):
+    """
+    Stops using an endpoint that refused the request or answered with unexpected JSON.
+    The product page is polled until the weekly check looks the endpoint up again.
+    """
+    url = load_inventory_endpoint().get("url")
+    log_message(f"Inventory endpoint rejected ({reason}), polling the product page: {url}")
+    save_inventory_endpoint(None)
+
+def discover_inventory_endpoint(page_bytes):
+    """
+    Looks for an inventory XHR for SKU in a full product page and caches its URL, or None
+    if the page doesn't reference one (HTML polling is used until the next check).
+    """
+    url = None
+    # Carousels on the page reference other SKUs' button states, so only take one that asks for ours
+    for match in INVENTORY_PATH_RE.finditer(page_bytes):
+        candidate = urljoin(CHECK_URL, html.unescape(match.group(0).decode("utf-8", "replace")))
+        skus = parse_qs(urlsplit(candidate).query).get("skus", [])
+        if any(SKU in value.split(",") for value in skus):
+            url = candidate
+            break
+
+    if url != load_inventory_endpoint().get("url"):
+        log_message(f"Inventory endpoint: {url or 'not found, polling the product page'}")
+    save_inventory_endpoint(url)
+
+def parse_inventory_status(data):
+    """
+    Maps the inventory endpoint's button state for SKU to "in_stock", "sold_out", or "fail".
+    Returns None if the JSON isn't in the expected shape or has no entry for SKU.
+    """
+    try:
+        button_state = next(info["buttonState"] for info in data["buttonStateResponseInfos"]
+                            if str(info.get("skuId")) == SKU)
+    except (KeyError, TypeError, AttributeError, StopIteration):
+        return None
+
+    if button_state == "ADD_TO_CART":
+        return "in_stock"
+    elif button_state == "SOLD_OUT":
+        return "sold_out"
+    else:
+        return "fail"
+
+async def send_with_retry(client, request, stream=False):
+    """
+    Sends a request on the shared async client. A kept-alive connection may have gone stale
+    during a long wait; it is dropped from the pool, so the request is retried once.
+    """
+    try:
+        return await client.send(request, stream=stream)
+    except (httpx.ConnectError, httpx.RemoteProtocolError):
+        return await client.send(request, stream=stream)
+
+async def check_inventory_endpoint_async(client, url):
+    """
+    Polls the JSON inventory endpoint. Returns the status, or None if the product page
+    should be checked instead. Transport errors, 429s and 5xx only skip the endpoint for
+    this poll; other 4xx responses and unexpected JSON reject it until the weekly check.
+    """
+    try:
+        request = client.build_request("GET", url, headers=INVENTORY_HEADERS)
+        response = await send_with_retry(client, request)
+    except httpx.HTTPError as e:
+        log_message(f"Inventory endpoint unavailable ({e!r}), checking the product page this time.")
+        return None
+
+    if response.status_code == 429 or response.status_code >= 500:
+        log_message(f"Inventory endpoint unavailable (HTTP {response.status_code}), checking the product page this time.")
+        return None
+    if response.status_code != 200:
+        reject_inventory_endpoint(f"HTTP {response.status_code}")
+        return None
+
+    try:
+        current_status = parse_inventory_status(response.json())
+    except ValueError:
+        current_status = None
+    if current_status is None:
+        reject_inventory_endpoint("unexpected JSON")
+    return current_status
+
+def get_response_time(response_headers):
+    """
+    Returns the server's Date header in local time, so saved pages are named after the
+    server's clock. Falls back to the local clock if the header is missing or malformed.
+    """
+    date_header = response_headers.get("Date")
+    if date_header:
+        try:
+            return parsedate_to_datetime(date_header).astimezone()
+        except (TypeError, ValueError):
+            pass
+    return datetime.now()
+
+def write_html(path, page_bytes):
+    """
+    Writes a fetched page to disk via a hidden temp file that is renamed into place,
+    so nothing watching the directory sees a partial file. Runs on the I/O thread.
+    """
+    directory, filename = os.path.split(path)
+    temp_path = os.path.join(directory, f".{filename}.tmp")
+    try:
+        with open(temp_path, "wb") as f:
+            f.write(page_bytes)
+        os.replace(temp_path, path)
+    except OSError as e:
+        log_message(f"Error saving {path}: {e}")
+
+def remove_saved_file(path):
+    """Deletes a saved page that fell out of the queue. Runs on the I/O thread."""
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
 def check_status(save_html=False, saved_files_queue=None):
     """
-    Fetches the page with disguised headers.
-    Returns "sold_out", "in_stock", or "fail".
+    Fetches the full product page over the shared HTTP/2 client with disguised headers,
+    for test interactive mode. Returns "sold_out", "in_stock", or "fail".
+    Also looks the JSON inventory endpoint up again when that is due.
 
-    If save_html=True, saves the response to a timestamped file in the current dir,
-    only keeping last N in saved_files_queue.
+    If save_html=True, saves the page to a timestamped file in the responses/ dir,
+    only keeping last N in saved_files_queue. The file writes and deletes are handed
+    to the I/O thread so they don't hold up the fetch.
     """
     try:
-        response = requests.get(CHECK_URL, headers=HEADERS, timeout=10)
-        page_text = response.text
+        request = CLIENT.build_request("GET", CHECK_URL)
+        try:
+            response = CLIENT.send(request)
+        except (httpx.ConnectError, httpx.RemoteProtocolError):
+            # The kept-alive connection may have gone stale; it is dropped from the pool, so retry once
+            response = CLIENT.send(request)
 
-        if SOLD_OUT_TEXT in page_text:
-            current_status = "sold_out"
-        elif ADD_TO_CART_MARKER in page_text:
-            current_status = "in_stock"
-        else:
-            current_status = "fail"
+        page_bytes = response.content
+        current_status = parse_status(page_bytes)
+        if response.status_code == 200 and inventory_endpoint_needs_check():
+            discover_inventory_endpoint(page_bytes)
 
         if save_html and saved_files_queue is not None:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"bestbuy_{timestamp}_{current_status}.html"
-            with open(filename, "w", encoding="utf-8") as f:
-                f.write(page_text)
-            saved_files_queue.append(filename)
+            timestamp = get_response_time(response.headers).strftime(_TS_FILE)
+            path = os.path.join(RESPONSES_DIR, f"bestbuy_{timestamp}_{current_status}.html")
+            _IO_POOL.submit(write_html, path, page_bytes)
+            saved_files_queue.append(path)
             # Only keep last N
             if len(saved_files_queue) > MAX_SAVED_RESPONSES:
                 oldest_file = saved_files_queue.popleft()
-                try:
-                    os.remove(oldest_file)
-                except OSError:
-                    pass
+                _IO_POOL.submit(remove_saved_file, oldest_file)
 
         return current_status
 
@@ -190,15 +524,80 @@ def check_status(save_html=False, saved_files_queue=None):
         log_message(f"Error fetching the URL: {e}")
         return "fail"
 
+async def check_status_async(client):
+    """
+    Checks stock for monitor mode, using a shared httpx.AsyncClient with disguised headers.
+    Returns "sold_out", "in_stock", or "fail".
+
+    When the product page references a JSON inventory endpoint, that small response is
+    polled instead of the page. Otherwise the page request is conditional on the last
+    page seen (a 304 returns the previous status), and the body is streamed until a
+    marker is found. The full page is read when the endpoint needs to be looked up.
+    """
+    try:
+        inventory_url = load_inventory_endpoint().get("url")
+        if inventory_url and not inventory_endpoint_needs_check():
+            current_status = await check_inventory_endpoint_async(client, inventory_url)
+            if current_status:
+                return current_status
+
+        find_endpoint = inventory_endpoint_needs_check()
+        request_headers = {} if find_endpoint else get_conditional_headers()
+
+        request = client.build_request("GET", CHECK_URL, headers=request_headers)
+        response = await send_with_retry(client, request, stream=True)
+        try:
+            if response.status_code == 304:
+                return _last_status
+
+            if find_endpoint:
+                page_bytes = await response.aread()
+                current_status = parse_status(page_bytes)
+                if response.status_code == 200:
+                    discover_inventory_endpoint(page_bytes)
+            else:
+                current_status = "fail"
+                tail = b""
+                async for chunk in response.aiter_bytes(chunk_size=CHUNK_SIZE):
+                    status, tail = scan_chunk(tail, chunk)
+                    if status:
+                        current_status = status
+                    # Stop at the sold-out text; after an add-to-cart marker keep reading,
+                    # since a later sold-out banner still takes precedence
+                    if status == "sold_out":
+                        break
+
+            if response.status_code == 200:
+                remember_validators(response.headers, current_status)
+            return current_status
+
+        finally:
+            await response.aclose()
+
+    except Exception as e:
+        log_message(f"Error fetching the URL: {e}")
+        return "fail"
+
 # ------------------------------------------------------------------------
 # 6. place_call()
 # ------------------------------------------------------------------------
+def get_twilio_client():
+    """
+    Returns the Twilio client, importing twilio and creating it on first use
+    so runs that never place a call don't pay for it.
+    """
+    global _twilio_client
+    if _twilio_client is None:
+        from twilio.rest import Client
+        _twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+    return _twilio_client
+
 def place_call(message: str):
     """
     Places a phone call via Twilio, reading `message` with text-to-speech.
     """
     try:
-        call = twilio_client.calls.create(
+        call = get_twilio_client().calls.create(
             twiml=f'<Response><Say>{message}</Say></Response>',
             to=TO_PHONE,
             from_=FROM_PHONE
@@ -235,32 +634,55 @@ def handle_status_change(current_status, last_status):
 # ------------------------------------------------------------------------
 # 8. Monitor Mode
 # ------------------------------------------------------------------------
-def monitor_mode():
+async def monitor_mode():
     """
     Checks Best Buy at intervals based on day/time. Logs everything with timestamps.
     Only calls if 'in_stock'.
     """
     cleanup_old_logs()  # Purge logs older than 30 days
+    migrate_state_changes()
+
+    # Fail now rather than when the item comes in stock
+    missing = [name for name, value in (("TWILIO_ACCOUNT_SID", TWILIO_ACCOUNT_SID),
+                                        ("TWILIO_AUTH_TOKEN", TWILIO_AUTH_TOKEN),
+                                        ("FROM_PHONE", FROM_PHONE),
+                                        ("TO_PHONE", TO_PHONE)) if not value]
+    if missing:
+        log_message(f"Missing {', '.join(missing)} in .env. Calls can't be placed, exiting monitor mode.")
+        return
+    get_twilio_client()
+
     last_status = None
     log_message("Starting monitor mode. Checking at dynamic intervals (PT). Press Ctrl+C to stop.\n")
 
-    while True:
-        current_status = check_status(save_html=False)
-        last_status = handle_status_change(current_status, last_status)
+    async with httpx.AsyncClient(http2=True, headers=HEADERS, timeout=10.0, limits=HTTP_LIMITS) as client:
+        while True:
+            current_status = await check_status_async(client)
+            # Twilio's client is blocking, so run the status handling (and any call) off the loop
+            last_status = await asyncio.to_thread(handle_status_change, current_status, last_status)
 
-        wait_time_seconds = get_current_wait_time_seconds()
-        log_message(f"Next check in {wait_time_seconds // 60} minute(s).")
-        time.sleep(wait_time_seconds)
+            wait_time_seconds = get_current_wait_time_seconds()
+            log_message(f"Next check in {wait_time_seconds // 60} minute(s).")
+            flush_log_file()
+            await asyncio.sleep(wait_time_seconds)
 
 # ------------------------------------------------------------------------
 # 9. Test Interactive Mode
 # ------------------------------------------------------------------------
+# Keys that force a status in test interactive mode
+FORCED_STATUSES = {
+    "s": "sold_out",
+    "i": "in_stock",
+    "f": "fail"
+}
+
 def test_interactive_mode():
     """
     Force statuses or fetch page, applying same status-change logic as monitor mode.
     """
     cleanup_old_logs()  # Purge old logs on start
-    saved_files_queue = deque(maxlen=MAX_SAVED_RESPONSES)
+    migrate_state_changes()
+    saved_files_queue = deque()  # Pruned to MAX_SAVED_RESPONSES by check_status()
     last_status = None
 
     log_message("Entering TEST INTERACTIVE MODE.")
@@ -271,12 +693,8 @@ def test_interactive_mode():
         if user_input == "q":
             log_message("Exiting Test Interactive Mode.")
             break
-        elif user_input in ["s", "i", "f"]:
-            forced_status = {
-                "s": "sold_out",
-                "i": "in_stock",
-                "f": "fail"
-            }[user_input]
+        elif user_input in FORCED_STATUSES:
+            forced_status = FORCED_STATUSES[user_input]
             last_status = handle_status_change(forced_status, last_status)
         elif user_input == "":
             current_status = check_status(save_html=True, saved_files_queue=saved_files_queue)
@@ -288,13 +706,16 @@ def test_interactive_mode():
 # 10. Main Launcher
 # ------------------------------------------------------------------------
 if __name__ == "__main__":
+    signal.signal(signal.SIGTERM, handle_shutdown_signal)
+    signal.signal(signal.SIGINT, handle_shutdown_signal)
+
     log_message("Select a Mode:")
     log_message("1) Monitor Mode (variable intervals M-F 6am-2pm PT => 1 min, else => 10 min)")
     log_message("2) Test Interactive Mode (force statuses or fetch)")
 
     mode_choice = input("Enter 1 or 2: ").strip()
     if mode_choice == "1":
-        monitor_mode()
+        asyncio.run(monitor_mode())
     elif mode_choice == "2":
         test_interactive_mode()
     else: